@@ -1,5 +1,5 @@
-from interpreter import Program
-from tkinter import Tk, Canvas, simpledialog, messagebox
+from interpreter import Program, DIR_DXDY
+from tkinter import Tk, Canvas, Text, simpledialog, messagebox
 from tkinter.ttk import Frame, Label, Button
 from enum import StrEnum
 from collections.abc import Generator
@@ -29,14 +29,21 @@ class CanvasOffset:
 class Tile:
     world_x: int = 0
     world_y: int = 0
+    coords: tuple[int, int] = (0, 0)
+    """(world_x, world_y), built once so lookups don't allocate a fresh tuple"""
 
     canvas: Canvas
     rect: int
-    text: int
+    text: int | None
+    """canvas text item, created lazily since most tiles never show a label"""
 
     program: Program
 
-    info: str = ""
+    last_cfg: tuple[str, str, int, str] | None = None
+    """the (fill, outline, width, text) last sent to Tk, to skip no-op calls"""
+
+    last_pos_key: tuple[int, int, int, int] | None = None
+    """the (world_x, world_y, offset_x, offset_y) last sent via canvas.coords"""
 
     mouse_on: bool = False
     show_info: Callable[[str], None]
@@ -53,7 +60,7 @@ class Tile:
         self.canvas = canvas
         self.program = program
         self.rect = canvas.create_rectangle(0, 0, 0, 0)
-        self.text = canvas.create_text(0, 0)
+        self.text = None
         self.show_info = show_info
         self.offset = offset
         canvas.tag_bind(self.rect, "<Enter>", lambda _: self.mouse_over())
@@ -61,7 +68,28 @@ class Tile:
 
     def mouse_over(self):
         self.mouse_on = True
-        self.show_info(self.info)
+        self.show_info(self.info())
+
+    def info(self) -> str:
+        """The hover description for this tile, built on demand; only the tile
+        under the mouse ever pays for the string formatting."""
+        coords = self.world_coords()
+        if coords == self.program.depot_pos:
+            return f"Bucket depot @ {coords}"
+        elif coords == self.program.tap_pos:
+            return f"Tap @ {coords}"
+        elif coords == self.program.pond_pos:
+            return f"Pond @ {coords}"
+        elif coords in self.program.buckets:
+            bucket = self.program.buckets[coords]
+            if bucket.water > 0:
+                return f"{bucket.capacity // 100} pint bucket with {bucket.holes} holes, {bucket.water / 100} pints full @ {coords}"
+            else:
+                return f"Empty {bucket.capacity // 100} pint bucket with {bucket.holes} holes @ {coords}"
+        elif coords in self.program.water and self.program.water[coords] != 0:
+            return f"Ground wet with {self.program.water[coords] / 100} pints @ {coords}"
+        else:
+            return f"Dry ground @ {coords}"
 
     def mouse_out(self) -> None:
         self.mouse_on = False
@@ -69,14 +97,20 @@ class Tile:
     def set_world_coords(self, x: int, y: int) -> Self:
         self.world_x = x
         self.world_y = y
-
-        self.canvas.tag_raise(self.text)
+        self.coords = (x, y)
 
         self.update()
 
         return self
 
     def update_canvas_pos(self):
+        pos_key = (self.world_x, self.world_y, self.offset[0], self.offset[1])
+        if pos_key == self.last_pos_key:
+            # neither the tile nor the canvas offset has moved, so the items
+            # are already where they should be
+            return
+        self.last_pos_key = pos_key
+
         x = self.world_x + self.offset[0]
         y = self.world_y + self.offset[1]
 
@@ -87,82 +121,78 @@ class Tile:
             x * TILE_SIZE + TILE_SIZE,
             y * TILE_SIZE + TILE_SIZE,
         )
-        self.canvas.coords(
-            self.text, x * TILE_SIZE + TILE_SIZE // 2, y * TILE_SIZE + TILE_SIZE // 2
-        )
+        if self.text is not None:
+            self.canvas.coords(
+                self.text,
+                x * TILE_SIZE + TILE_SIZE // 2,
+                y * TILE_SIZE + TILE_SIZE // 2,
+            )
 
     def update(self) -> None:
 
         self.update_canvas_pos()
 
-        if self.world_coords() == self.program.depot_pos:
-            self.canvas.itemconfigure(
-                self.rect, fill="#783302", outline="#565656", width=2
-            )
-            self.info = f"Bucket depot @ {self.world_coords()}"
-            self.canvas.itemconfigure(self.text, text="depot")
-        elif self.world_coords() == self.program.tap_pos:
-            self.canvas.itemconfigure(
-                self.rect, fill="#565656", outline="black", width=0
-            )
-            self.info = f"Tap @ {self.world_coords()}"
-            self.canvas.itemconfigure(self.text, text="tap")
-        elif self.world_coords() == self.program.pond_pos:
-            self.canvas.itemconfigure(
-                self.rect, fill="#00786E", outline="black", width=0
-            )
-            self.info = f"Pond @ {self.world_coords()}"
-            self.canvas.itemconfigure(self.text, text="pond")
-        elif self.world_coords() in self.program.buckets:
-            bucket = self.program.buckets[self.world_coords()]
+        coords = self.coords
+
+        if coords == self.program.depot_pos:
+            fill, outline, width = "#783302", "#565656", 2
+            text = "depot"
+        elif coords == self.program.tap_pos:
+            fill, outline, width = "#565656", "black", 0
+            text = "tap"
+        elif coords == self.program.pond_pos:
+            fill, outline, width = "#00786E", "black", 0
+            text = "pond"
+        elif coords in self.program.buckets:
+            bucket = self.program.buckets[coords]
             if bucket.water > 0:
-                self.canvas.itemconfigure(
-                    self.rect, fill="#0162D0", outline="#783302", width=5
-                )
-                self.info = f"{bucket.capacity // 100} pint bucket with {bucket.holes} holes, {bucket.water / 100} pints full @ {self.world_coords()}"
-                self.canvas.itemconfigure(self.text, text=f"{bucket.water / 100}")
+                fill, outline, width = "#0162D0", "#783302", 5
+                text = f"{bucket.water / 100}"
             else:
-                self.canvas.itemconfigure(
-                    self.rect, fill="#783302", outline="#5c2702", width=5
-                )
-                self.info = f"Empty {bucket.capacity // 100} pint bucket with {bucket.holes} holes @ {self.world_coords()}"
-                self.canvas.itemconfigure(self.text, text="empty")
+                fill, outline, width = "#783302", "#5c2702", 5
+                text = "empty"
         else:
-            if (
-                self.world_coords() not in self.program.water
-                or self.program.water[self.world_coords()] == 0
-            ):
-                self.canvas.itemconfigure(
-                    self.rect, fill="#00a500", outline="black", width=1
-                )
-                self.info = f"Dry ground @ {self.world_coords()}"
-                self.canvas.itemconfigure(self.text, text="")
+            if coords not in self.program.water or self.program.water[coords] == 0:
+                fill, outline, width = "#00a500", "black", 1
+                text = ""
             else:
-                self.canvas.itemconfigure(
-                    self.rect, fill="#009fa5", outline="black", width=1
-                )
-                self.info = f"Ground wet with {self.program.water[self.world_coords()] / 100} pints @ {self.world_coords()}"
-                self.canvas.itemconfigure(
-                    self.text,
-                    text=f"{self.program.water[self.world_coords()] / 100}",
+                fill, outline, width = "#009fa5", "black", 1
+                text = f"{self.program.water[coords] / 100}"
+
+        if coords == self.program.pos:
+            outline, width = "red", 5
+
+        cfg = (fill, outline, width, text)
+        if cfg != self.last_cfg:
+            self.canvas.itemconfigure(self.rect, fill=fill, outline=outline, width=width)
+            if self.text is not None:
+                self.canvas.itemconfigure(self.text, text=text)
+            elif text != "":
+                x = self.world_x + self.offset[0]
+                y = self.world_y + self.offset[1]
+                self.text = self.canvas.create_text(
+                    x * TILE_SIZE + TILE_SIZE // 2,
+                    y * TILE_SIZE + TILE_SIZE // 2,
+                    text=text,
+                    tags=("tiletext",),
                 )
-
-        if self.world_coords() == self.program.pos:
-            self.canvas.itemconfigure(self.rect, outline="red", width=5)
-            self.canvas.tag_raise(self.rect)
-            self.canvas.tag_raise(self.text)
+            self.last_cfg = cfg
+            if coords == self.program.pos:
+                self.canvas.tag_raise(self.rect)
 
         if self.mouse_on:
-            self.show_info(self.info)
+            self.show_info(self.info())
 
     def world_coords(self) -> tuple[int, int]:
-        return (self.world_x, self.world_y)
+        return self.coords
 
 
 CANVAS_SIZE = 594
 
 TILE_NUM = ceil(CANVAS_SIZE / TILE_SIZE)
 
+MAX_OUTPUT_LINES = 1000
+
 
 class GUI:
     program: Program
@@ -172,6 +202,7 @@ class GUI:
     status: ProgramStatus
     runner: Generator[None]
     running: bool = False
+    tick_id: str | None = None
 
     status_label: Label
     line_label: Label
@@ -181,10 +212,11 @@ class GUI:
     step_time_button: Button
     run_button: Button
     canvas: Canvas
-    output_box: Label
+    output_box: Text
 
     step_wait: int = 1000
     tiles: list[Tile]
+    tiles_by_coord: dict[tuple[int, int], Tile]
     canvas_offset: CanvasOffset = CanvasOffset()
     created_tiles: list[int] = [
         0,
@@ -192,6 +224,8 @@ class GUI:
         0,
         0,
     ]  # furthest up, down, left, right
+    last_pos: tuple[int, int] | None = None
+    last_hover_text: str = ""
 
     def __init__(self, filename: str) -> None:
         self.filename = filename
@@ -204,6 +238,7 @@ class GUI:
         self.program = program
 
         self.program.output = self.output
+        self.program.output_char = self.output_char
         self.program.input_char = self.input_char
         self.program.input_int = self.input_int
         self.program.error = self.error
@@ -211,6 +246,7 @@ class GUI:
         self.window = Tk()
 
         self.tiles = []
+        self.tiles_by_coord = {}
 
         frame = Frame(self.window, padding=10)
         frame.grid()
@@ -263,17 +299,13 @@ class GUI:
         Label(button_frame, text="Output:").grid(
             column=0, row=5, sticky="W", pady=(20, 5)
         )
-        self.output_box = Label(button_frame, text="")
+        self.output_box = Text(button_frame, width=24, height=8, state="disabled")
         self.output_box.grid(column=0, row=6, sticky="W")
 
         self.canvas_offset.offset = ((TILE_NUM - 1) // 2, (TILE_NUM - 1) // 2)
 
         for i, j in product(range(TILE_NUM), range(TILE_NUM)):
-            self.tiles.append(
-                Tile(
-                    self.canvas, self.program, self.show_hover_text, self.canvas_offset
-                ).set_world_coords(i - self.canvas_offset[0], j - self.canvas_offset[1])
-            )
+            self.add_tile(i - self.canvas_offset[0], j - self.canvas_offset[1])
         self.created_tiles = [
             -self.canvas_offset[0],
             TILE_NUM - self.canvas_offset[0],
@@ -284,11 +316,23 @@ class GUI:
         self.window.mainloop()
 
     def show_hover_text(self, text: str) -> None:
+        if text == self.last_hover_text:
+            return
+        self.last_hover_text = text
         self.hover_label["text"] = text
 
+    def add_tile(self, x: int, y: int) -> None:
+        tile = Tile(
+            self.canvas, self.program, self.show_hover_text, self.canvas_offset
+        ).set_world_coords(x, y)
+        self.tiles.append(tile)
+        self.tiles_by_coord[(x, y)] = tile
+
     def update(self):
         self.update_status_label()
 
+        old_offset = self.canvas_offset.offset
+
         self.canvas_offset.offset = (
             (TILE_NUM - 1) // 2 - self.program.pos[0],
             (TILE_NUM - 1) // 2 - self.program.pos[1],
@@ -296,87 +340,47 @@ class GUI:
 
         if -self.canvas_offset[0] < self.created_tiles[2]:
             for i in range(self.created_tiles[0], self.created_tiles[1]):
-                self.tiles.append(
-                    Tile(
-                        self.canvas,
-                        self.program,
-                        self.show_hover_text,
-                        self.canvas_offset,
-                    ).set_world_coords(-self.canvas_offset[0], i)
-                )
+                self.add_tile(-self.canvas_offset[0], i)
             self.created_tiles[2] = -self.canvas_offset[0]
         if TILE_NUM - self.canvas_offset[0] >= self.created_tiles[3]:
             for i in range(self.created_tiles[0], self.created_tiles[1]):
-                self.tiles.append(
-                    Tile(
-                        self.canvas,
-                        self.program,
-                        self.show_hover_text,
-                        self.canvas_offset,
-                    ).set_world_coords(TILE_NUM - self.canvas_offset[0], i)
-                )
+                self.add_tile(TILE_NUM - self.canvas_offset[0], i)
                 self.created_tiles[3] = TILE_NUM - self.canvas_offset[0] + 1
         if -self.canvas_offset[1] < self.created_tiles[0]:
             for i in range(self.created_tiles[2], self.created_tiles[3]):
-                self.tiles.append(
-                    Tile(
-                        self.canvas,
-                        self.program,
-                        self.show_hover_text,
-                        self.canvas_offset,
-                    ).set_world_coords(i, -self.canvas_offset[1])
-                )
+                self.add_tile(i, -self.canvas_offset[1])
                 self.created_tiles[0] = -self.canvas_offset[1]
         if TILE_NUM - self.canvas_offset[1] >= self.created_tiles[1]:
             for i in range(self.created_tiles[2], self.created_tiles[3]):
-                self.tiles.append(
-                    Tile(
-                        self.canvas,
-                        self.program,
-                        self.show_hover_text,
-                        self.canvas_offset,
-                    ).set_world_coords(i, TILE_NUM - self.canvas_offset[1])
-                )
+                self.add_tile(i, TILE_NUM - self.canvas_offset[1])
                 self.created_tiles[1] = TILE_NUM - self.canvas_offset[1] + 1
 
-        for tile in self.tiles:
-            tile.update()
+        if self.canvas_offset.offset != old_offset or self.last_pos is None:
+            # the whole grid shifted (or this is the first/reset frame), so
+            # every tile needs repositioning anyway
+            for tile in self.tiles:
+                tile.update()
+        else:
+            for coords in self.program.dirty | {self.last_pos, self.program.pos}:
+                tile = self.tiles_by_coord.get(coords)
+                if tile is not None:
+                    tile.update()
+        self.program.dirty.clear()
+        self.last_pos = self.program.pos
 
         centre = CANVAS_SIZE // 2
         t = TILE_SIZE // 4
-        match self.program.direction:
-            case "N":
-                self.canvas.coords(
-                    self.direction_line,
-                    centre,
-                    centre + t,
-                    centre,
-                    centre + TILE_SIZE // 2,
-                )
-            case "E":
-                self.canvas.coords(
-                    self.direction_line,
-                    centre + t,
-                    centre,
-                    centre + TILE_SIZE // 2,
-                    centre,
-                )
-            case "S":
-                self.canvas.coords(
-                    self.direction_line,
-                    centre,
-                    centre - t,
-                    centre,
-                    centre - TILE_SIZE // 2,
-                )
-            case "W":
-                self.canvas.coords(
-                    self.direction_line,
-                    centre - t,
-                    centre,
-                    centre - TILE_SIZE // 2,
-                    centre,
-                )
+        dx, dy = DIR_DXDY[self.program.direction]
+        self.canvas.coords(
+            self.direction_line,
+            centre + dx * t,
+            centre + dy * t,
+            centre + dx * (TILE_SIZE // 2),
+            centre + dy * (TILE_SIZE // 2),
+        )
+        # one raise for every tile label (covers any tiles created this frame)
+        # rather than one Tcl call per tile
+        self.canvas.tag_raise("tiletext")
         self.canvas.tag_raise(self.direction_line)
 
         bucket = self.program.current_bucket
@@ -402,6 +406,10 @@ class GUI:
                 f"My hands are empty. I am wearing {self.program.wellies_count} pairs of wellies"
             )
 
+        # flush pending geometry/item changes in one go without forcing a full
+        # event-loop re-entry per itemconfigure
+        self.canvas.update_idletasks()
+
     def change_step_time(self):
         new_time = simpledialog.askinteger(
             "Leaky buckets", "Step wait time (ms):", minvalue=1
@@ -410,17 +418,25 @@ class GUI:
             self.step_wait = new_time
 
     def update_status_label(self):
-        self.status_label["text"] = (
-            f"{self.status}: {self.filename} @ L{self.program.line_counter}"
-        )
         if self.program.line_counter < len(self.program.lines):
+            # line_counter is an op index; report the 1-based source line,
+            # matching what error messages show
+            source_line = self.program.source_line_for[self.program.line_counter] + 1
             self.line_label["text"] = self.program.lines[self.program.line_counter]  # type: ignore
         else:
+            # past the last op: one beyond the last instruction's source line
+            # (or line 1 if the program had no instructions at all)
+            source_line_for = self.program.source_line_for
+            source_line = source_line_for[-1] + 2 if source_line_for else 1
             self.line_label["text"] = ""
+        self.status_label["text"] = (
+            f"{self.status}: {self.filename} @ L{source_line}"
+        )
         self.step_time_label["text"] = f"Step wait time: {self.step_wait}ms"
 
     def reset(self):
         self.program.__init__()
+        self.last_pos = None
         self.step_button["state"] = "enabled"
         self.running = False
         self.run_button["text"] = "Run"
@@ -428,7 +444,6 @@ class GUI:
         self.update()
 
     def step(self):
-        self.update()
         try:
             next(self.runner)
         except StopIteration:
@@ -436,38 +451,59 @@ class GUI:
             self.step_button["state"] = "disabled"
             if self.running:
                 self.toggle_run()
-        self.update()
+        # coalesce the post-step redraw with Tk's own idle loop rather than
+        # repainting synchronously
+        self.window.after_idle(self.update)
 
-    def run(self) -> None:
+    def tick(self) -> None:
+        if not self.running:
+            return
+        self.step()
         if self.running:
-            self.step()
-            self.window.after(self.step_wait, self.run)
+            self.tick_id = self.window.after(self.step_wait, self.tick)
 
     def toggle_run(self) -> None:
         self.running = not self.running
         if not self.running:
             self.run_button["text"] = "Run"
+            if self.tick_id is not None:
+                self.window.after_cancel(self.tick_id)
+                self.tick_id = None
         else:
             self.run_button["text"] = "Pause"
-            self.run()
+            # make sure the frame being stepped away from is on screen before
+            # the first instruction runs
+            self.update()
+            self.tick()
+
+    def append_output(self, text: str) -> None:
+        self.output_box.configure(state="normal")
+        self.output_box.insert("end", text)
+        lines = int(self.output_box.index("end-1c").split(".")[0])
+        if lines > MAX_OUTPUT_LINES:
+            self.output_box.delete("1.0", f"{lines - MAX_OUTPUT_LINES + 1}.0")
+        self.output_box.configure(state="disabled")
+        self.output_box.see("end")
 
     def output(self, output: str | int | float):
-        if isinstance(output, str):
-            self.output_box["text"] += output
-        else:
-            self.output_box["text"] += f"\n{output}"
+        self.append_output(f"\n{output}")
+
+    def output_char(self, char: str):
+        self.append_output(char)
 
     def input_char(self, prompt: str = "Enter a character:") -> int:
-        char = simpledialog.askstring("Leaky buckets input", prompt)
-        if char is None:
-            return self.input_char("Enter a character (got None last time):")
-        return ord(char)
+        while True:
+            char = simpledialog.askstring("Leaky buckets input", prompt)
+            if char is not None:
+                return ord(char)
+            prompt = "Enter a character (got None last time):"
 
     def input_int(self, prompt: str = "Enter an integer:") -> int:
-        i = simpledialog.askinteger("Leaky buckets input", prompt)
-        if i is None:
-            return self.input_int("Enter an integer (got None last time):")
-        return i
+        while True:
+            i = simpledialog.askinteger("Leaky buckets input", prompt)
+            if i is not None:
+                return i
+            prompt = "Enter an integer (got None last time):"
 
     def error(self, error: str, line_num: int | None = None, type: str = "") -> Never:
         if line_num is None:
@@ -4,8 +4,11 @@
 
 import argparse
 import re
+import sys
+from bisect import bisect_left
 from dataclasses import dataclass
-from typing import Never, Literal
+from enum import IntEnum
+from typing import Any, Never
 from collections.abc import Generator, Callable
 
 # the following definition of getch (get character) is from
@@ -30,18 +33,22 @@ class _Getch:
 
 class _GetchUnix:
     def __init__(self):
-        import tty, sys  # type: ignore
+        # imported once here (failure falls through to the platform probe in
+        # _Getch) and bound, rather than re-imported on every character
+        import tty, termios  # type: ignore
 
-    def __call__(self):
-        import sys, tty, termios
+        self.tty = tty
+        self.termios = termios
+        self.fd = sys.stdin.fileno()
 
-        fd = sys.stdin.fileno()
-        old_settings = termios.tcgetattr(fd)
+    def __call__(self):
+        termios = self.termios
+        old_settings = termios.tcgetattr(self.fd)
         try:
-            tty.setraw(sys.stdin.fileno())
+            self.tty.setraw(self.fd)
             ch = sys.stdin.read(1)
         finally:
-            termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, old_settings)
         return ch
 
 
@@ -49,16 +56,21 @@ class _GetchWindows:
     def __init__(self):
         import msvcrt  # type: ignore
 
-    def __call__(self):  # type: ignore
-        import msvcrt
+        self.msvcrt = msvcrt
 
-        return msvcrt.getch()  # type: ignore
+    def __call__(self):  # type: ignore
+        return self.msvcrt.getch()  # type: ignore
 
 
 _getch: _Getch = _Getch()
 
+_STDIN_IS_TTY = sys.stdin.isatty()
+
 
 def getch() -> str:
+    if not _STDIN_IS_TTY:
+        # piped input: read straight from the stream, no raw-mode dance or echo
+        return sys.stdin.read(1)
     ch: str = _getch()
     print(ch, end="")  # type: ignore
     return ch  # type: ignore
@@ -79,49 +91,97 @@ def unreachable(line_num: int | None = None) -> Never:
 
 facing = "(in front of me|to my left|behind me|to my right)"
 
+# source normalisation, applied once per line in parse_lines: one combined
+# pattern strips the comment and collapses whitespace runs in a single pass
+RE_COMMENT_WS = re.compile(r"(?:--.+$)|\s+")
+
+
+def _normalise_sub(match: re.Match[str]) -> str:
+    # the two alternatives are distinguishable by their first character
+    return "" if match[0][0] == "-" else " "
+
+# all instruction patterns, compiled once at import and only ever applied once
+# per source line, in compile_line
+RE_COLLECT = re.compile(r"collect a (\d+|max) pint bucket(?: with (\d+) holes)?\Z")
+RE_TURN = re.compile(r"turn (left|right|around|all the way around)\Z")
+RE_FILL_TOP = re.compile(r"fill the bucket to the top\Z")
+RE_GOD_FILL = re.compile(r"let god fill the bucket as he wishes\Z")
+RE_FILL_N = re.compile(r"fill the bucket with (\d+|max) pints of water\Z")
+RE_PLACE = re.compile(rf"place the bucket down {facing}\Z")
+RE_PICK_UP = re.compile(rf"pick up the bucket {facing}\Z")
+RE_EMPTY_SQUARE = re.compile(
+    rf"empty the bucket on ?to the square {facing}( without overflow)?\Z"
+)
+RE_EMPTY_HERE = re.compile(r"empty the bucket here\Z")
+RE_MOVE = re.compile(r"move (?:(1) step|(\d+) steps)\Z")
+RE_SHRINK = re.compile(r"shrink my bucket\Z")
+RE_VOID = re.compile(r"i wish to scream in ?to the void\Z")
+RE_SPEAK = re.compile(r"i wish to speak to god\Z")
+RE_HEAR = re.compile(r"i wish to hear from god\Z")
+RE_WELLIES_RETURNED = re.compile(r"i wish to have my wellies returned(?: to me)?\Z")
+RE_WELLIES_ON = re.compile(r"put wellies on\Z")
+RE_WELLIES_OFF = re.compile(r"take wellies off\Z")
+RE_EVAPORATE = re.compile(r"evaporate (?:(1) pint|(\d+) pints)\Z")
+
+
+type Direction = int
+"""0-3, clockwise from north, so that composing two turns is (a + b) & 3"""
+
+NORTH: Direction = 0
+EAST: Direction = 1
+SOUTH: Direction = 2
+WEST: Direction = 3
 
-def facing_to_relative_dir(facing: str):
-    match facing:
-        case "in front of me":
-            return "N"
-        case "behind me":
-            return "S"
-        case "to my right":
-            return "E"
-        case "to my left":
-            return "W"
-        case _:
-            unreachable()
+type Pos = tuple[int, int]
 
+MAX_CAPACITY = 100 * ((1 << 32) - 1)
+"""the 'max' bucket size (2^32 - 1 pints), in centipints"""
 
-type Direction = Literal["N"] | Literal["E"] | Literal["S"] | Literal["W"]
+# position delta for each direction, indexed by the direction itself
+DIR_DXDY: tuple[Pos, Pos, Pos, Pos] = ((0, 1), (1, 0), (0, -1), (-1, 0))
 
-directions: list[Direction] = ["N", "E", "S", "W"]
 
-type Pos = tuple[int, int]
+FACING_REL: dict[str, Direction] = {
+    "in front of me": NORTH,
+    "behind me": SOUTH,
+    "to my right": EAST,
+    "to my left": WEST,
+}
+
+
+def facing_to_relative_dir(facing: str) -> Direction:
+    try:
+        return FACING_REL[facing]
+    except KeyError:
+        unreachable()
 
 
 def relative_direction_to_absolute(
     current_dir: Direction, relative_dir: Direction
 ) -> Direction:
-    return directions[
-        (directions.index(current_dir) + directions.index(relative_dir)) % 4
-    ]
+    return (current_dir + relative_dir) & 3
 
 
-def direction_to_relative_pos(absolute_dir: Direction) -> Pos:
-    return [(0, 1), (1, 0), (0, -1), (-1, 0)][directions.index(absolute_dir)]
+def pour_water(
+    src_water: int, dst_water: int, dst_capacity: int, allow_overflow: bool
+) -> tuple[int, int, int]:
+    """Pour as much of src_water into a destination bucket as will fit.
+
+    Returns the new (src_water, dst_water, overflowed) amounts; overflowed is
+    only ever non-zero when allow_overflow is set."""
+    remaining_capacity = dst_capacity - dst_water
+    if remaining_capacity > src_water:
+        return 0, dst_water + src_water, 0
+    if not allow_overflow:
+        return src_water - remaining_capacity, dst_capacity, 0
+    return 0, dst_capacity, src_water - remaining_capacity
 
 
 def add_pos(pos1: Pos, pos2: Pos):
     return (pos1[0] + pos2[0], pos1[1] + pos2[1])
 
 
-def mul_pos(scalar: int, pos: Pos):
-    return (scalar * pos[0], scalar * pos[1])
-
-
-@dataclass
+@dataclass(slots=True)
 class Bucket:
     """capacity in centipints"""
 
@@ -131,27 +191,68 @@ class Bucket:
     water: int = 0
 
 
-@dataclass
+class Mode(IntEnum):
+    """what emptying into the pond (or god-fill input) should do; int-valued
+    so the per-instruction comparisons are small-int equality checks"""
+
+    NUM = 0
+    ASCII = 1
+    VOID = 2
+    WELLIES_LOOP = 3
+    ASCII_IN = 4
+
+
+@dataclass(slots=True)
 class Branch:
     n: int
 
 
+type Handler = Callable[["Program", Any, int], Branch | int | None]
+
+type Op = tuple[Handler, Any]
+"""a compiled instruction: the handler to call and its pre-parsed arguments
+(whose shape depends on the instruction; None if it takes none)"""
+
+
 @dataclass
 class Program:
     buckets: dict[Pos, Bucket]
+    leaky_buckets: dict[Pos, Bucket]
+    """the subset of buckets with holes, mirrored on place/pick up so the
+    per-tick leak sweep only visits buckets that can actually leak"""
     water: dict[Pos, int]  # pos -> centipints
+    dirty: set[Pos]
+    """positions mutated during the current tick, for incremental redraws"""
     pos: Pos
     direction: Direction
+    front_pos: Pos
+    """the square directly in front, cached whenever pos or direction
+    changes (turn, move and the wellies-loop return)"""
     depot_pos: Pos
     tap_pos: Pos
     pond_pos: Pos
+    static_positions: frozenset[Pos]
+    """the fixed depot/tap/pond squares, for O(1) occupancy tests"""
+    depot_inited: bool
+    tap_inited: bool
+    pond_inited: bool
     current_bucket: Bucket | None
-    mode: str
-    mode_changed: bool
+    mode: Mode
+    """the mode most recently wished for; only in force on the very next
+    instruction — consult current_mode() rather than reading this directly"""
+    mode_set_at: int
+    """the tick on which mode was last set by an 'i wish ...' instruction"""
     wellies_count: int
     wellies_stack: list[tuple[int, Pos, Direction]]
     time: int
     lines: list[str] | None
+    ops: list[Op] | None
+    """compiled form of lines: a (handler, args) pair per instruction,
+    resolved once in parse_lines rather than on every execution"""
+    source_line_for: list[int]
+    """op index -> 0-based line index in the original source, for errors"""
+    wellies_off_indices: list[int]
+    """sorted op indices of 'take wellies off', for O(log n) branch jumps"""
     line_counter: int
 
     def error(self, error: str, line_num: int | None = None, type: str = "") -> Never:
@@ -159,438 +260,561 @@ class Program:
 
     def __init__(self):
         self.buckets = dict()
+        self.leaky_buckets = dict()
         self.water = dict()
+        self.dirty = set()
         self.pos = (0, 0)
+        self.front_pos = (0, 1)
         self.depot_pos = (0, 1)
         self.tap_pos = (1, 1)
         self.pond_pos = (-1, 1)
+        self.static_positions = frozenset(
+            (self.depot_pos, self.tap_pos, self.pond_pos)
+        )
         self.depot_inited = False
         self.tap_inited = False
         self.pond_inited = False
         self.current_bucket = None
-        self.direction = "N"
-        self.mode = "num"
-        self.mode_changed = False
+        self.direction = NORTH
+        self.mode = Mode.NUM
+        self.mode_set_at = -2
         self.wellies_count = 0
         self.wellies_stack = []
         self.time = 0
         self.line_counter = 0
 
     def output(self, output: str | int | float):
-        print(output)
+        """Print a value on its own line (num-mode pond output)."""
+        # skip print()'s argument handling; stdout stays block-buffered when
+        # redirected, so print-heavy programs aren't flushing per line
+        sys.stdout.write(f"{output}\n")
+
+    def output_char(self, char: str):
+        """Print an ascii-mode character.
+
+        Identical to output() on the CLI, but the GUI appends these inline
+        rather than starting a new line."""
+        sys.stdout.write(f"{char}\n")
 
     def input_char(self) -> int:
         return ord(getch())
 
     def input_int(self) -> int:
-        return int(input())
+        return int(sys.stdin.readline())
 
     def parse_lines(self, lines: list[str]) -> None:
-        self.lines = [
-            re.sub(r"\s+", " ", re.sub("--.+$", "", line.strip().lower()))
-            for line in lines
+        normalised = [
+            RE_COMMENT_WS.sub(_normalise_sub, line.lower()).strip() for line in lines
+        ]
+        # blank lines are dropped from the executed stream entirely;
+        # source_line_for keeps error messages pointing at the original file
+        self.lines = [line for line in normalised if line]
+        self.source_line_for = [i for i, line in enumerate(normalised) if line]
+        self.ops = [self.compile_line(line) for line in self.lines]
+        self.wellies_off_indices = [
+            i for i, op in enumerate(self.ops) if op[0] is Program.eval_wellies_off
         ]
 
+    def compile_line(self, line: str) -> Op:
+        entries = DISPATCH.get(line.partition(" ")[0])
+        if entries is not None:
+            for pattern, handler, compile_args in entries:
+                if match := pattern.match(line):
+                    args = None if compile_args is None else compile_args(match)
+                    return (handler, args)
+        # an unparseable line is only an error if it is actually executed
+        return (Program.eval_unknown, None)
+
     def run_iter(self) -> Generator[None, None, None]:
-        lines = self.lines
-        if lines is None:
-            self.error("self.lines was not initialised before running", type="Internal")
+        ops = self.ops
+        if ops is None:
+            self.error("self.ops was not initialised before running", type="Internal")
         self.line_counter = 0
-        branch_countdown = 0
-        while self.line_counter < len(lines):
-            if lines[self.line_counter] != "":
-                if branch_countdown > 0:
-                    if lines[self.line_counter] == "take wellies off":
-                        branch_countdown -= 1
-                    self.line_counter += 1
-                    continue
-                next_line = self.run_line(
-                    lines[self.line_counter], self.line_counter + 1
+        while self.line_counter < len(ops):
+            next_line = self.run_line(
+                ops[self.line_counter], self.source_line_for[self.line_counter] + 1
+            )
+            yield
+            if isinstance(next_line, Branch):
+                # jump straight past the n'th 'take wellies off' below the
+                # current line, rather than skipping line-by-line
+                target = (
+                    bisect_left(self.wellies_off_indices, self.line_counter + 1)
+                    + next_line.n
+                    - 1
                 )
-                yield
-                if isinstance(next_line, Branch):
-                    branch_countdown = next_line.n
-                    self.line_counter += 1
-                elif next_line is not None:
-                    self.line_counter = next_line
-                else:
-                    self.line_counter += 1
+                if target >= len(self.wellies_off_indices):
+                    self.error(
+                        "terminated without finding correct branch to take off wellies"
+                    )
+                self.line_counter = self.wellies_off_indices[target] + 1
+            elif next_line is not None:
+                self.line_counter = next_line
             else:
                 self.line_counter += 1
-        if branch_countdown > 0:
-            self.error("terminated without finding correct branch to take off wellies")
 
     def run(self) -> None:
         runner = self.run_iter()
         try:
             while True:
                 next(runner)
+                # nothing consumes dirty on the CLI path; clear it here so it
+                # doesn't grow without bound
+                self.dirty.clear()
         except StopIteration:
             pass
 
     def leak_water_onto(self, pos: Pos, water: int) -> None:
-        if pos in self.water:
-            self.water[pos] += water
-        else:
-            self.water[pos] = water
+        if not water:
+            return
+        self.dirty.add(pos)
+        ground = self.water
+        ground[pos] = ground.get(pos, 0) + water
 
     def pos_is_occupied(self, pos: Pos):
-        return (pos in self.buckets) or (
-            pos in [self.depot_pos, self.tap_pos, self.pond_pos]
-        )
-
-    def run_line(self, line: str, line_num: int) -> Branch | int | None:
-        # print(line)
-        # print(self.pos, self.direction, self.buckets)
-        self.mode_changed = False
-        for pos in list(self.water):
-            self.water[pos] = max(0, self.water[pos] - 1)
-            if self.water[pos] == 0:
-                del self.water[pos]
-        for pos, bucket in self.buckets.items():
-            if bucket.holes == 0:
-                continue
-            bucket.water = max(0, bucket.water - bucket.holes)
-            even_water = int(min(bucket.holes, bucket.water) // 4)
-            self.leak_water_onto(
-                add_pos(pos, direction_to_relative_pos(directions[self.time % 4])),
-                min(bucket.holes, bucket.water) % 4,
-            )
-            for direction in directions:
-                self.leak_water_onto(
-                    add_pos(pos, direction_to_relative_pos(direction)), even_water
-                )
+        return (pos in self.buckets) or (pos in self.static_positions)
+
+    def update_front_pos(self) -> None:
+        x, y = self.pos
+        dx, dy = DIR_DXDY[self.direction]
+        self.front_pos = (x + dx, y + dy)
+
+    def leak_tick(self) -> None:
+        """One time unit's worth of leaking, for every holed bucket on the
+        grid and the held bucket (if any)."""
+        if not self.leaky_buckets:
+            self.leak_held_bucket()
+            return
+        ground = self.water
+        dirty = self.dirty
+        rot_dx, rot_dy = DIR_DXDY[self.time & 3]
+        for pos, bucket in self.leaky_buckets.items():
+            # the bucket's own square is dirty too: its water level changes,
+            # and the GUI draws that level as the tile's label
+            dirty.add(pos)
+            water = bucket.water - bucket.holes
+            bucket.water = water if water > 0 else 0
+            leaked = min(bucket.holes, bucket.water)
+            even_water = leaked // 4
+            x, y = pos
+            # leak_water_onto inlined: these five updates per bucket are the
+            # hottest dict writes in the interpreter
+            remainder = leaked % 4
+            if remainder:
+                rot_pos = (x + rot_dx, y + rot_dy)
+                dirty.add(rot_pos)
+                ground[rot_pos] = ground.get(rot_pos, 0) + remainder
+            if even_water:
+                for dx, dy in DIR_DXDY:
+                    neighbour = (x + dx, y + dy)
+                    dirty.add(neighbour)
+                    ground[neighbour] = ground.get(neighbour, 0) + even_water
+        self.leak_held_bucket()
+
+    def leak_held_bucket(self) -> None:
         if self.current_bucket is not None and self.current_bucket.holes != 0:
-            self.current_bucket.water = max(
-                0, self.current_bucket.water - self.current_bucket.holes
-            )
+            water = self.current_bucket.water - self.current_bucket.holes
+            self.current_bucket.water = water if water > 0 else 0
             self.leak_water_onto(
                 self.pos, min(self.current_bucket.holes, self.current_bucket.water)
             )
-        next_line = self.eval_line(line, line_num)
-        if not self.mode_changed:
-            self.mode = "num"
+
+    def current_mode(self) -> Mode:
+        # a wish only covers the instruction directly after it; rather than
+        # resetting self.mode to NUM on every tick, derive the effective mode
+        # from when it was last wished for
+        return self.mode if self.time == self.mode_set_at + 1 else Mode.NUM
+
+    def run_line(self, op: Op, line_num: int) -> Branch | int | None:
+        # print(self.pos, self.direction, self.buckets)
+        # dirty is cleared by its consumers (GUI.update after painting, run's
+        # loop on the CLI path), not here: clearing at the start of a tick
+        # would discard changes a deferred repaint hasn't drawn yet
+        # ground water stays a sparse dict keyed by position: the grid is
+        # unbounded and usually almost entirely dry, so scanning the wet cells
+        # beats any dense-array representation for realistic programs
+        if self.water:
+            self.dirty.update(self.water)
+            self.water = {
+                pos: level - 1 for pos, level in self.water.items() if level > 1
+            }
+        self.leak_tick()
+        handler, args = op
+        next_line = handler(self, args, line_num)
         self.time += 1
         return next_line
 
-    def eval_line(self, line: str, line_num: int) -> Branch | int | None:
-        if match := re.match(
-            r"collect a (\d+|max) pint bucket( with (\d+) holes)?", line
-        ):
-            if match.lastindex is not None and match.lastindex > 1:
-                holes = int(match[3])
-            else:
-                holes = 0
-            if (
-                add_pos(self.pos, direction_to_relative_pos(self.direction))
-                != self.depot_pos
-            ):
-                self.error(
-                    "must be facing bucket depot in order to collect a bucket",
-                    type="Runtime",
-                )
-            if self.current_bucket is not None:
-                self.error(
-                    "cannot collect a bucket; already holding one", line_num, "Runtime"
-                )
-            if match[1] == "max":
-                capacity = 100 * (pow(2, 32) - 1)
-            else:
-                capacity = 100 * int(match[1])
-            self.current_bucket = Bucket(capacity, holes)
-            return
-        if match := re.match(r"turn (left|right|around|all the way around)", line):
-            if self.current_bucket is not None:
-                self.error("cannot turn around while holding a bucket", line_num, "Runtime")
-            # print(self.pos in self.water and self.water[self.pos])
-            if self.pos in self.water and self.water[self.pos] >= 100:
-                n = int(self.water[self.pos] // 100)
-                if self.mode == "wellies_loop":
-                    if self.wellies_count == 0:
-                        self.error("fell over with no wellies on")
-                    # print("fell over; looping")
-                    self.wellies_count -= 1
-                    loop_start = self.wellies_stack.pop()
-                    self.pos = loop_start[1]
-                    self.direction = loop_start[2]
-                    return loop_start[0]
-                else:
-                    if n > self.wellies_count:
-                        self.error(
-                            "fell over and didn't have enough wellies on",
-                            line_num,
-                            "Runtime",
-                        )
-                    # print(f"fell over; branching {n}")
-                    return Branch(n)
-            match match[1]:
-                case "left":
-                    rel_dir = "W"
-                case "right":
-                    rel_dir = "E"
-                case "around":
-                    rel_dir = "S"
-                case "all the way around":
-                    rel_dir = "N"
-                case _:
-                    self.error("unreachable", line_num)
-            self.direction = relative_direction_to_absolute(self.direction, rel_dir)
-            return
-        if match := re.match(r"fill the bucket to the top", line):
-            if (
-                add_pos(self.pos, direction_to_relative_pos(self.direction))
-                != self.tap_pos
-            ):
-                self.error(
-                    "must be facing the tap in order to fill a bucket",
-                    line_num,
-                    "Runtime",
-                )
-            if self.current_bucket is None:
-                self.error(
-                    "must be holding a bucket in order to fill it", line_num, "Runtime"
-                )
-            self.current_bucket.water = self.current_bucket.capacity
-            return
-        if match := re.match(r"let god fill the bucket as he wishes", line):
-            if self.current_bucket is None:
-                self.error(
-                    "must be holding a bucket in order to fill it", line_num, "Runtime"
-                )
-            if self.mode == "ascii_in":
-                new_water = 100 * self.input_char()
-            else:
-                new_water = 100 * self.input_int()
-            if self.current_bucket.water + new_water > self.current_bucket.capacity:
-                self.error("exceeded capacity of bucket when filling", line_num, "Runtime")
-            self.current_bucket.water += new_water
-            return
-        if match := re.match(r"fill the bucket with (\d+) pints of water", line):
-            if (
-                add_pos(self.pos, direction_to_relative_pos(self.direction))
-                != self.tap_pos
-            ):
-                self.error(
-                    "must be facing the tap in order to fill a bucket",
-                    line_num,
-                    "Runtime",
-                )
-            if self.current_bucket is None:
-                self.error(
-                    "must be holding a bucket in order to fill it", line_num, "Runtime"
-                )
-            if match[1] == "max":
-                water = 100 * pow(2, 32) - 1
+    def eval_unknown(self, args: Any, line_num: int) -> Branch | int | None:
+        self.error("unknown instruction", line_num)
+
+    def eval_collect(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.front_pos != self.depot_pos:
+            self.error(
+                "must be facing bucket depot in order to collect a bucket",
+                type="Runtime",
+            )
+        if self.current_bucket is not None:
+            self.error(
+                "cannot collect a bucket; already holding one", line_num, "Runtime"
+            )
+        capacity, holes = args
+        self.current_bucket = Bucket(capacity, holes)
+        return
+
+    def eval_turn(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.current_bucket is not None:
+            self.error("cannot turn around while holding a bucket", line_num, "Runtime")
+        # print(self.pos in self.water and self.water[self.pos])
+        if self.pos in self.water and self.water[self.pos] >= 100:
+            n = int(self.water[self.pos] // 100)
+            if self.current_mode() == Mode.WELLIES_LOOP:
+                if self.wellies_count == 0:
+                    self.error("fell over with no wellies on")
+                # print("fell over; looping")
+                self.wellies_count -= 1
+                loop_line, loop_pos, loop_direction = self.wellies_stack.pop()
+                self.dirty.add(self.pos)
+                self.pos = loop_pos
+                self.dirty.add(loop_pos)
+                self.direction = loop_direction
+                self.update_front_pos()
+                return loop_line
             else:
-                water = 100 * int(match[1])
-            if self.current_bucket.water + water > self.current_bucket.capacity:
-                self.error("exceeded capacity of bucket when filling", line_num, "Runtime")
-            self.current_bucket.water += water
-            return
-        if match := re.match(rf"place the bucket down {facing}", line):
-            if self.current_bucket is None:
-                self.error(
-                    "must be holding a bucket in order to put it down",
-                    line_num,
-                    "Runtime",
-                )
-            bucket_pos = add_pos(
-                self.pos,
-                direction_to_relative_pos(
-                    relative_direction_to_absolute(
-                        self.direction, facing_to_relative_dir(match[1])
+                if n > self.wellies_count:
+                    self.error(
+                        "fell over and didn't have enough wellies on",
+                        line_num,
+                        "Runtime",
                     )
-                ),
+                # print(f"fell over; branching {n}")
+                return Branch(n)
+        self.direction = relative_direction_to_absolute(self.direction, args)
+        self.update_front_pos()
+        return
+
+    def eval_fill_top(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.front_pos != self.tap_pos:
+            self.error(
+                "must be facing the tap in order to fill a bucket",
+                line_num,
+                "Runtime",
             )
-            if self.pos_is_occupied(bucket_pos):
-                self.error(
-                    "cannot place a bucket in an occupied position", line_num, "Runtime"
-                )
-            self.buckets[bucket_pos] = self.current_bucket
-            self.current_bucket = None
-            return
-        if match := re.match(rf"pick up the bucket {facing}", line):
-            if self.current_bucket is not None:
-                self.error(
-                    "must not be holding a bucket in order to pick one up",
-                    line_num,
-                    "Runtime",
-                )
-            bucket_pos = add_pos(
-                self.pos,
-                direction_to_relative_pos(
-                    relative_direction_to_absolute(
-                        self.direction, facing_to_relative_dir(match[1])
-                    )
-                ),
+        if self.current_bucket is None:
+            self.error(
+                "must be holding a bucket in order to fill it", line_num, "Runtime"
+            )
+        self.current_bucket.water = self.current_bucket.capacity
+        return
+
+    def eval_fill_n(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.front_pos != self.tap_pos:
+            self.error(
+                "must be facing the tap in order to fill a bucket",
+                line_num,
+                "Runtime",
+            )
+        if self.current_bucket is None:
+            self.error(
+                "must be holding a bucket in order to fill it", line_num, "Runtime"
+            )
+        water = args
+        if self.current_bucket.water + water > self.current_bucket.capacity:
+            self.error("exceeded capacity of bucket when filling", line_num, "Runtime")
+        self.current_bucket.water += water
+        return
+
+    def eval_god_fill(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.current_bucket is None:
+            self.error(
+                "must be holding a bucket in order to fill it", line_num, "Runtime"
+            )
+        if self.current_mode() == Mode.ASCII_IN:
+            new_water = 100 * self.input_char()
+        else:
+            new_water = 100 * self.input_int()
+        if self.current_bucket.water + new_water > self.current_bucket.capacity:
+            self.error("exceeded capacity of bucket when filling", line_num, "Runtime")
+        self.current_bucket.water += new_water
+        return
+
+    def eval_place(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.current_bucket is None:
+            self.error(
+                "must be holding a bucket in order to put it down",
+                line_num,
+                "Runtime",
+            )
+        bucket_pos = add_pos(
+            self.pos, DIR_DXDY[relative_direction_to_absolute(self.direction, args)]
+        )
+        if self.pos_is_occupied(bucket_pos):
+            self.error(
+                "cannot place a bucket in an occupied position", line_num, "Runtime"
+            )
+        self.buckets[bucket_pos] = self.current_bucket
+        if self.current_bucket.holes:
+            self.leaky_buckets[bucket_pos] = self.current_bucket
+        self.current_bucket = None
+        self.dirty.add(bucket_pos)
+        return
+
+    def eval_pick_up(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.current_bucket is not None:
+            self.error(
+                "must not be holding a bucket in order to pick one up",
+                line_num,
+                "Runtime",
+            )
+        bucket_pos = add_pos(
+            self.pos, DIR_DXDY[relative_direction_to_absolute(self.direction, args)]
+        )
+        if bucket_pos not in self.buckets:
+            self.error(
+                "cannot pick up a bucket from an unoccupied position",
+                line_num,
+                "Runtime",
+            )
+        self.current_bucket = self.buckets[bucket_pos]
+        del self.buckets[bucket_pos]
+        self.leaky_buckets.pop(bucket_pos, None)
+        self.dirty.add(bucket_pos)
+        return
+
+    def eval_empty_square(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.current_bucket is None:
+            self.error(
+                "must be holding a bucket in order to empty it", line_num, "Runtime"
+            )
+        rel_dir, allow_overflow = args
+        empty_pos = add_pos(
+            self.pos, DIR_DXDY[relative_direction_to_absolute(self.direction, rel_dir)]
+        )
+        self.dirty.add(empty_pos)
+        if empty_pos in self.buckets:
+            other_bucket = self.buckets[empty_pos]
+            (
+                self.current_bucket.water,
+                other_bucket.water,
+                overflowed,
+            ) = pour_water(
+                self.current_bucket.water,
+                other_bucket.water,
+                other_bucket.capacity,
+                allow_overflow,
             )
-            if bucket_pos not in self.buckets:
+            if overflowed:
+                even_water = overflowed // 4
+                x, y = empty_pos
+                for dx, dy in DIR_DXDY:
+                    self.leak_water_onto((x + dx, y + dy), even_water)
+                rot_dx, rot_dy = DIR_DXDY[self.time & 3]
+                px, py = self.pos
+                self.leak_water_onto((px + rot_dx, py + rot_dy), even_water)
+        elif empty_pos == self.pond_pos:
+            if not allow_overflow:
                 self.error(
-                    "cannot pick up a bucket from an unoccupied position",
+                    "it is not a valid instruction to empty into the pond without overflow",
                     line_num,
                     "Runtime",
                 )
-            self.current_bucket = self.buckets[bucket_pos]
-            del self.buckets[bucket_pos]
-            return
-        if match := re.match(
-            rf"empty the bucket on ?to the square {facing}( without overflow)?", line
-        ):
-            if self.current_bucket is None:
-                self.error(
-                    "must be holding a bucket in order to empty it", line_num, "Runtime"
-                )
-            empty_pos = add_pos(
-                self.pos,
-                direction_to_relative_pos(
-                    relative_direction_to_absolute(
-                        self.direction, facing_to_relative_dir(match[1])
-                    )
-                ),
-            )
-            if empty_pos in self.buckets:
-                other_bucket = self.buckets[empty_pos]
-                remaining_capacity = other_bucket.capacity - other_bucket.water
-                if remaining_capacity > self.current_bucket.water:
-                    other_bucket.water += self.current_bucket.water
-                    self.current_bucket.water = 0
-                elif match.lastindex is not None and match.lastindex > 1:
-                    other_bucket.water = other_bucket.capacity
-                    self.current_bucket.water -= remaining_capacity
-                else:
-                    other_bucket.water = other_bucket.capacity
-                    overflowed = self.current_bucket.water - remaining_capacity
-                    even_water = int(overflowed // 4)
-                    for direction in directions:
-                        self.leak_water_onto(
-                            add_pos(empty_pos, direction_to_relative_pos(direction)),
-                            even_water,
-                        )
-                    self.leak_water_onto(
-                        add_pos(
-                            self.pos,
-                            direction_to_relative_pos(directions[self.time % 4]),
-                        ),
-                        even_water,
-                    )
-                    self.current_bucket.water = 0
-            elif empty_pos == self.pond_pos:
-                if match.lastindex is not None and match.lastindex > 1:
-                    self.error(
-                        "it is not a valid instruction to empty into the pond without overflow",
-                        line_num,
-                        "Runtime",
-                    )
-                match self.mode:
-                    case "num":
-                        if self.current_bucket.water % 100 == 0:
-                            self.output(int(self.current_bucket.water // 100))
-                        else:
-                            self.output(self.current_bucket.water * 0.01)
-                    case "ascii":
-                        if self.current_bucket.water % 100 == 0:
-                            if self.current_bucket.water // 100 < 128:
-                                self.output(chr(self.current_bucket.water // 100))
-                            else:
-                                self.error(
-                                    "couldn't print as ascii bucket for which water level was > 127",
-                                    line_num,
-                                    "Runtime",
-                                )
+            match self.current_mode():
+                case Mode.NUM:
+                    water = self.current_bucket.water
+                    if water % 100 == 0:
+                        self.output(water // 100)
+                    else:
+                        self.output(f"{water // 100}.{water % 100:02d}")
+                case Mode.ASCII:
+                    if self.current_bucket.water % 100 == 0:
+                        if self.current_bucket.water // 100 < 128:
+                            self.output_char(chr(self.current_bucket.water // 100))
                         else:
                             self.error(
-                                "couldn't print as ascii bucket for which water level was not an integer",
+                                "couldn't print as ascii bucket for which water level was > 127",
                                 line_num,
                                 "Runtime",
                             )
-                    case "void" | "wellies_loop" | "ascii_in":
-                        pass
-                    case _:
-                        unreachable(line_num)
-                self.current_bucket.water = 0
-            else:
-                if match.lastindex is not None and match.lastindex > 1:
-                    self.error(
-                        "it is not a valid instruction to empty onto the floor without overflow",
-                        line_num,
-                        "Runtime",
-                    )
-                if empty_pos in self.water:
-                    self.water[empty_pos] += self.current_bucket.water
-                else:
-                    self.water[empty_pos] = self.current_bucket.water
-                self.current_bucket.water = 0
-            return
-        if match := re.match(rf"empty the bucket here", line):
-            if self.current_bucket is None:
-                self.error(
-                    "must be holding a bucket in order to empty it", line_num, "Runtime"
-                )
-            if self.pos in self.water:
-                self.water[self.pos] += self.current_bucket.water
-            else:
-                self.water[self.pos] = self.current_bucket.water
+                    else:
+                        self.error(
+                            "couldn't print as ascii bucket for which water level was not an integer",
+                            line_num,
+                            "Runtime",
+                        )
+                case Mode.VOID | Mode.WELLIES_LOOP | Mode.ASCII_IN:
+                    pass
+                case _:
+                    unreachable(line_num)
             self.current_bucket.water = 0
-            return
-        if match := re.match(rf"move ((1) step|((\d)+) steps)", line):
-            length = int(match[2] or match[3])
-            route = [
-                add_pos(self.pos, mul_pos(s, direction_to_relative_pos(self.direction)))
-                for s in range(1, length + 1)
-            ]
-            if any(map(self.pos_is_occupied, route)):
-                self.error("tripped over an occupied position :(", line_num, "Runtime")
-            self.pos = add_pos(
-                self.pos,
-                mul_pos(length, direction_to_relative_pos(self.direction)),
-            )
-            return
-        if match := re.match(rf"shrink my bucket", line):
-            if self.current_bucket is None:
-                self.error(
-                    "must be holding a bucket in order to shrink it",
-                    line_num,
-                    "Runtime",
-                )
-            self.current_bucket.capacity = self.current_bucket.water
-            return
-        if match := re.match(rf"i wish to scream in ?to the void", line):
-            self.mode = "void"
-            self.mode_changed = True
-            return
-        if match := re.match(rf"i wish to speak to god", line):
-            self.mode = "ascii"
-            self.mode_changed = True
-            return
-        if match := re.match(rf"i wish to hear from god", line):
-            self.mode = "ascii_in"
-            self.mode_changed = True
-            return
-        if match := re.match(rf"i wish to have my wellies returned", line):
-            self.mode = "wellies_loop"
-            self.mode_changed = True
-            return
-        if match := re.match(rf"put wellies on", line):
-            self.wellies_count += 1
-            self.wellies_stack.append((line_num - 1, self.pos, self.direction))
-            return
-        if match := re.match(rf"take wellies off", line):
-            if self.wellies_count == 0:
+        else:
+            if not allow_overflow:
                 self.error(
-                    "can't take off wellies when you have no wellies on",
+                    "it is not a valid instruction to empty onto the floor without overflow",
                     line_num,
                     "Runtime",
                 )
-            self.wellies_count -= 1
-            self.wellies_stack.pop()
-            return
-        if match := re.match(r"evaporate ((1) pint|(\d+) pints)", line):
-            if self.pos in self.water:
-                self.water[self.pos] = max(
-                    0, self.water[self.pos] - 100 * int(match[2] or match[3])
-                )
-            return
-        self.error("unknown instruction", line_num)
+            self.water[empty_pos] = (
+                self.water.get(empty_pos, 0) + self.current_bucket.water
+            )
+            self.current_bucket.water = 0
+        return
+
+    def eval_empty_here(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.current_bucket is None:
+            self.error(
+                "must be holding a bucket in order to empty it", line_num, "Runtime"
+            )
+        self.dirty.add(self.pos)
+        self.water[self.pos] = self.water.get(self.pos, 0) + self.current_bucket.water
+        self.current_bucket.water = 0
+        return
+
+    def eval_move(self, args: Any, line_num: int) -> Branch | int | None:
+        length = args
+        x, y = self.pos
+        dx, dy = DIR_DXDY[self.direction]
+        for _ in range(length):
+            x += dx
+            y += dy
+            if self.pos_is_occupied((x, y)):
+                self.error("tripped over an occupied position :(", line_num, "Runtime")
+        self.dirty.add(self.pos)
+        self.pos = (x, y)
+        self.dirty.add(self.pos)
+        self.update_front_pos()
+        return
+
+    def eval_shrink(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.current_bucket is None:
+            self.error(
+                "must be holding a bucket in order to shrink it",
+                line_num,
+                "Runtime",
+            )
+        self.current_bucket.capacity = self.current_bucket.water
+        return
+
+    def eval_scream(self, args: Any, line_num: int) -> Branch | int | None:
+        self.mode = Mode.VOID
+        self.mode_set_at = self.time
+        return
+
+    def eval_speak(self, args: Any, line_num: int) -> Branch | int | None:
+        self.mode = Mode.ASCII
+        self.mode_set_at = self.time
+        return
+
+    def eval_hear(self, args: Any, line_num: int) -> Branch | int | None:
+        self.mode = Mode.ASCII_IN
+        self.mode_set_at = self.time
+        return
+
+    def eval_wellies_returned(self, args: Any, line_num: int) -> Branch | int | None:
+        self.mode = Mode.WELLIES_LOOP
+        self.mode_set_at = self.time
+        return
+
+    def eval_wellies_on(self, args: Any, line_num: int) -> Branch | int | None:
+        self.wellies_count += 1
+        # the loop target is the op index, not the source line number
+        self.wellies_stack.append((self.line_counter, self.pos, self.direction))
+        return
+
+    def eval_wellies_off(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.wellies_count == 0:
+            self.error(
+                "can't take off wellies when you have no wellies on",
+                line_num,
+                "Runtime",
+            )
+        self.wellies_count -= 1
+        self.wellies_stack.pop()
+        return
+
+    def eval_evaporate(self, args: Any, line_num: int) -> Branch | int | None:
+        if self.pos in self.water:
+            self.dirty.add(self.pos)
+            water = self.water[self.pos] - args
+            self.water[self.pos] = water if water > 0 else 0
+        return
+
+# argument pre-parsers, run once per source line in compile_line so that the
+# handlers never touch a match object at execution time
+
+TURN_REL: dict[str, Direction] = {
+    "left": WEST,
+    "right": EAST,
+    "around": SOUTH,
+    "all the way around": NORTH,
+}
+
+
+def _collect_args(match: re.Match[str]) -> tuple[int, int]:
+    if match[1] == "max":
+        capacity = MAX_CAPACITY
+    else:
+        capacity = 100 * int(match[1])
+    holes = int(match[2]) if match[2] is not None else 0
+    return (capacity, holes)
+
+
+def _turn_args(match: re.Match[str]) -> Direction:
+    return TURN_REL[match[1]]
+
+
+def _fill_n_args(match: re.Match[str]) -> int:
+    if match[1] == "max":
+        return MAX_CAPACITY
+    return 100 * int(match[1])
+
+
+def _facing_args(match: re.Match[str]) -> Direction:
+    return facing_to_relative_dir(match[1])
+
+
+def _empty_square_args(match: re.Match[str]) -> tuple[Direction, bool]:
+    return (facing_to_relative_dir(match[1]), match[2] is None)
+
+
+def _move_args(match: re.Match[str]) -> int:
+    return int(match[1] or match[2])
+
+
+def _evaporate_args(match: re.Match[str]) -> int:
+    return 100 * int(match[1] or match[2])
+
+
+# dispatch on the first word of a (normalised) line: compile_line only ever
+# matches a line against the pattern(s) for its own instruction rather than
+# the whole chain, then pre-parses its arguments
+DISPATCH: dict[
+    str,
+    list[tuple[re.Pattern[str], Handler, Callable[[re.Match[str]], Any] | None]],
+] = {
+    "collect": [(RE_COLLECT, Program.eval_collect, _collect_args)],
+    "turn": [(RE_TURN, Program.eval_turn, _turn_args)],
+    "fill": [
+        (RE_FILL_TOP, Program.eval_fill_top, None),
+        (RE_FILL_N, Program.eval_fill_n, _fill_n_args),
+    ],
+    "let": [(RE_GOD_FILL, Program.eval_god_fill, None)],
+    "place": [(RE_PLACE, Program.eval_place, _facing_args)],
+    "pick": [(RE_PICK_UP, Program.eval_pick_up, _facing_args)],
+    "empty": [
+        (RE_EMPTY_SQUARE, Program.eval_empty_square, _empty_square_args),
+        (RE_EMPTY_HERE, Program.eval_empty_here, None),
+    ],
+    "move": [(RE_MOVE, Program.eval_move, _move_args)],
+    "shrink": [(RE_SHRINK, Program.eval_shrink, None)],
+    "i": [
+        (RE_VOID, Program.eval_scream, None),
+        (RE_SPEAK, Program.eval_speak, None),
+        (RE_HEAR, Program.eval_hear, None),
+        (RE_WELLIES_RETURNED, Program.eval_wellies_returned, None),
+    ],
+    "put": [(RE_WELLIES_ON, Program.eval_wellies_on, None)],
+    "take": [(RE_WELLIES_OFF, Program.eval_wellies_off, None)],
+    "evaporate": [(RE_EVAPORATE, Program.eval_evaporate, _evaporate_args)],
+}
 
 
 parser = argparse.ArgumentParser(